@@ -0,0 +1 @@
+Accept SQLite URIs (e.g. `file:sydent.db?mode=ro`) for the `db.file` option.
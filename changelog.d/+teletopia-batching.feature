@@ -0,0 +1 @@
+Send text messages through the Teletopia gateway in batches, over a persistent connection.
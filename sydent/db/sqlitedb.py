@@ -28,7 +28,13 @@ class SqliteDatabase:
         dbFilePath = self.sydent.cfg.get("db", "db.file")
         logger.info("Using DB file %s", dbFilePath)
 
-        self.db = sqlite3.connect(dbFilePath)
+        # Allow SQLite URIs (e.g. "file::memory:?cache=shared") as well as paths.
+        # Python 2's sqlite3 doesn't know about the uri argument, so only pass it
+        # when it's needed.
+        if dbFilePath.startswith("file:"):
+            self.db = sqlite3.connect(dbFilePath, uri=True)
+        else:
+            self.db = sqlite3.connect(dbFilePath)
         curVer = self._getSchemaVersion()
 
         # We always run the schema files if the version is zero: either the db is
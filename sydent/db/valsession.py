@@ -111,7 +111,7 @@ class ThreePidValSessionStore:
         """
         cur = self.sydent.db.cursor()
 
-        cur.execute("update threepid_token_auths set sendAttemptNumber = ? where id = ?", (attemptNo, sid))
+        cur.execute("update threepid_token_auths set sendAttemptNumber = ? where validationSession = ?", (attemptNo, sid))
         self.sydent.db.commit()
 
     def setValidated(self, sid, validated):
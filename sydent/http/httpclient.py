@@ -20,7 +20,7 @@ import logging
 from io import BytesIO
 
 from twisted.internet import defer
-from twisted.web.client import FileBodyProducer, Agent, readBody
+from twisted.web.client import FileBodyProducer, Agent, HTTPConnectionPool, readBody
 from twisted.web.http_headers import Headers
 from sydent.http.matrixfederationagent import MatrixFederationAgent
 
@@ -28,6 +28,11 @@ from sydent.http.federation_tls_options import ClientTLSOptionsFactory
 
 logger = logging.getLogger(__name__)
 
+# Number of idle connections the shared pool keeps open to each host. The SMS
+# gateways talk to a single host each, so this caps how many of their concurrent
+# requests can reuse a connection (see teletopia.MAX_CONCURRENT_REQUESTS).
+MAX_PERSISTENT_PER_HOST = 4
+
 
 class HTTPClient(object):
     """A base HTTP class that contains methods for making GET and POST HTTP
@@ -99,7 +104,6 @@ class HTTPClient(object):
 
         defer.returnValue(response)
 
-    @defer.inlineCallbacks
     def post_json_get_body(self, uri, post_json, opts):
         """Make a POST request to an endpoint returning JSON and parse result
 
@@ -119,6 +123,26 @@ class HTTPClient(object):
         """
         json_bytes = json.dumps(post_json).encode("utf8")
 
+        return self.post_json_bytes_get_body(uri, json_bytes, opts)
+
+    @defer.inlineCallbacks
+    def post_json_bytes_get_body(self, uri, json_bytes, opts):
+        """Make a POST request with an already serialised JSON body to an
+        endpoint and return the response along with its body
+
+        :param uri: The URI to make a POST request to.
+        :type uri: unicode
+
+        :param json_bytes: The JSON-encoded body to POST to the given URI.
+        :type json_bytes: bytes
+
+        :param opts: A dictionary of request options. Currently only opts.headers
+            is supported.
+        :type opts: dict[str,any]
+
+        :return: a tuple with the response from the remote server.
+        :rtype: twisted.internet.defer.Deferred[twisted.web.iweb.IResponse]
+        """
         headers = opts.get('headers', Headers({
             b"Content-Type": [b"application/json"],
         }))
@@ -151,8 +175,10 @@ class SimpleHttpClient(HTTPClient):
         self.agent = Agent(
             self.sydent.reactor,
             connectTimeout=15,
+            pool=self.sydent.http_pool,
         )
 
+
 class FederationHttpClient(HTTPClient):
     """HTTP client for federation requests to homeservers. Uses a
     MatrixFederationAgent.
@@ -163,3 +189,20 @@ class FederationHttpClient(HTTPClient):
             self.sydent.reactor,
             ClientTLSOptionsFactory(sydent.cfg),
         )
+
+
+def make_http_pool(reactor):
+    """Create a persistent connection pool for outbound HTTP requests, so that
+    repeated requests to the same host (e.g. an SMS gateway) can reuse an open
+    (and already TLS-negotiated) connection rather than opening a new one each
+    time.
+
+    :param reactor: The reactor to use for the pool's connections.
+    :type reactor: twisted.internet.interfaces.IReactorTime
+
+    :return: The connection pool.
+    :rtype: twisted.web.client.HTTPConnectionPool
+    """
+    pool = HTTPConnectionPool(reactor, persistent=True)
+    pool.maxPersistentPerHost = MAX_PERSISTENT_PER_HOST
+    return pool
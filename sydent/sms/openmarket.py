@@ -19,7 +19,6 @@ import logging
 from base64 import b64encode
 
 from twisted.internet import defer
-from sydent.http.httpclient import SimpleHttpClient
 from twisted.web.http_headers import Headers
 
 logger = logging.getLogger(__name__)
@@ -49,15 +48,16 @@ def tonFromType(t):
     :return: The type of number.
     :rtype: int
     """
-    if t in TONS:
+    try:
         return TONS[t]
-    raise Exception("Unknown number type (%s) for originator" % t)
+    except KeyError:
+        raise Exception("Unknown number type (%s) for originator" % t)
 
 
 class OpenMarketSMS:
     def __init__(self, sydent, config_section):
         self.sydent = sydent
-        self.http_cli = SimpleHttpClient(sydent)
+        self.http_cli = sydent.http_client
         self.smsConfig = config_section
 
 
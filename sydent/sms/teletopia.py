@@ -17,13 +17,27 @@
 from __future__ import absolute_import
 
 import logging
-from base64 import b64encode
 import json
 
 from twisted.internet import defer
-from sydent.http.httpclient import SimpleHttpClient
 from twisted.web.http_headers import Headers
 
+from sydent.http.httpclient import MAX_PERSISTENT_PER_HOST
+
+try:
+    # orjson is optional, but is a lot faster than the json module at handling
+    # the large payloads of batched sends.
+    import orjson
+
+    encode_json = orjson.dumps
+    decode_json = orjson.loads
+except ImportError:
+    def encode_json(obj):
+        return json.dumps(obj).encode("utf8")
+
+    def decode_json(json_bytes):
+        return json.loads(json_bytes.decode("utf8"))
+
 logger = logging.getLogger(__name__)
 
 
@@ -49,75 +63,218 @@ def tonFromType(t):
     :return: The type of number.
     :rtype: int
     """
-    if t in TONS:
+    try:
         return TONS[t]
-    raise Exception("Unknown number type (%s) for originator" % t)
+    except KeyError:
+        raise Exception("Unknown number type (%s) for originator" % t)
+
+
+# The end of the request body, after the last message.
+_BODY_SUFFIX = b']}'
+
+# Maximum number of messages sent to the gateway in a single request.
+BATCH_MAX_SIZE = 32
+
+# How long (in seconds) to wait for more messages to batch up before sending.
+BATCH_FLUSH_DELAY = 0.05
+
+# Maximum number of requests to the gateway in flight at the same time. This
+# matches the number of connections the shared HTTP pool keeps open per host, so
+# every request can reuse a connection.
+MAX_CONCURRENT_REQUESTS = MAX_PERSISTENT_PER_HOST
+
+# Maximum number of messages queued or waiting for the gateway's response. Past
+# that, new messages are rejected straight away rather than queued.
+MAX_QUEUED_MESSAGES = 1024
 
 
 class TeletopiaSMS:
     def __init__(self, sydent, config_section):
         self.sydent = sydent
-        self.http_cli = SimpleHttpClient(sydent)
+        self.http_cli = sydent.http_client
         self.smsConfig = config_section
 
-    @defer.inlineCallbacks
+        # The parts of the request which don't change between messages. The
+        # gateway's v3 JSON API takes the credentials in the request body rather
+        # than in an Authorization header.
+        self._headers = Headers({
+            b"Content-Type": [b"application/json"],
+        })
+        auth = {
+            "username": self.smsConfig.get('username'),
+            "password": self.smsConfig.get('password'),
+        }
+        # The request body is this prefix, then the comma-separated messages,
+        # then _BODY_SUFFIX.
+        self._bodyPrefix = b'{"auth":' + encode_json(auth) + b',"messages":['
+        self._defaultSender = {
+            "sender": "Matrix",
+            "senderType": TONS['alpha'],
+        }
+
+        # Messages waiting to be sent in the next batch, as a list of
+        # (encoded message, Deferred) tuples, and the pending call to send them.
+        self._pending = []
+        self._flushCall = None
+
+        # The number of messages which have been queued but not yet resolved, and
+        # the limiter for the number of concurrent requests to the gateway.
+        self._queued = 0
+        self._requestLimiter = defer.DeferredSemaphore(MAX_CONCURRENT_REQUESTS)
+
     def sendTextSMS(self, body, dest, source=None):
         """
-        Sends a text message with the given body to the given MSISDN.
+        Queues a text message with the given body to the given MSISDN. Queued
+        messages are sent to the gateway in batches, either once BATCH_MAX_SIZE
+        messages are queued or after BATCH_FLUSH_DELAY seconds, with at most
+        MAX_CONCURRENT_REQUESTS requests to the gateway in flight at once.
 
         :param body: The message to send.
         :type body: str
         :param dest: The destination MSISDN to send the text message to.
         :type dest: unicode
         :type source: dict[str, str] or None
+
+        :return: A deferred which resolves once the gateway has accepted the
+            message, or fails if it didn't or if MAX_QUEUED_MESSAGES messages are
+            already queued.
+        :rtype: twisted.internet.defer.Deferred
+        """
+        if self._queued >= MAX_QUEUED_MESSAGES:
+            logger.warn("Too many sms messages queued for Teletopia, rejecting message to %s", dest)
+            return defer.fail(Exception("Too many sms messages queued for Teletopia gateway"))
+
+        # Encode the message now, so that an invalid one (e.g. with an unknown
+        # originator type) only fails its own sender rather than its whole batch.
+        try:
+            encodedMessage = self._encodeMessage(body, dest, source)
+        except Exception:
+            return defer.fail()
+
+        self._queued += 1
+        d = defer.Deferred()
+        self._pending.append((encodedMessage, d))
+
+        if len(self._pending) >= BATCH_MAX_SIZE:
+            self._flush()
+        elif self._flushCall is None:
+            self._flushCall = self.sydent.reactor.callLater(
+                BATCH_FLUSH_DELAY, self._flush,
+            )
+
+        return d
+
+    def _flush(self):
+        """
+        Sends all the queued messages to the gateway in a single request (once
+        the number of requests in flight allows it), then resolves each message's
+        deferred with its own result.
+        """
+        if self._flushCall is not None:
+            if self._flushCall.active():
+                self._flushCall.cancel()
+            self._flushCall = None
+
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        def onResponses(ttResponses):
+            self._queued -= len(pending)
+            for i, (_, d) in enumerate(pending):
+                if i >= len(ttResponses):
+                    d.errback(Exception("Teletopia gateway returned no response for sms message"))
+                    continue
+                try:
+                    self._checkResponse(ttResponses[i])
+                except Exception:
+                    d.errback()
+                else:
+                    d.callback(None)
+
+        def onError(failure):
+            self._queued -= len(pending)
+            for _, d in pending:
+                d.errback(failure)
+
+        d = self._requestLimiter.run(
+            self._sendBatch, [message for message, _ in pending],
+        )
+        d.addCallbacks(onResponses, onError)
+
+    def _encodeMessage(self, body, dest, source):
         """
+        Encodes a single text message as the JSON the gateway expects in its
+        "messages" array.
 
-        username = self.smsConfig.get('username')
-        password = self.smsConfig.get('password')
+        :param body: The message to send.
+        :type body: str
+        :param dest: The destination MSISDN to send the text message to.
+        :type dest: unicode
+        :type source: dict[str, str] or None
 
-        if source==None:
-            source = {
-                "text": "Matrix",
-                "type": "alpha"
+        :return: The JSON-encoded message.
+        :rtype: bytes
+        """
+        if source is None:
+            ttMessage = self._defaultSender.copy()
+        else:
+            ttMessage = {
+                "sender": source['text'],
+                "senderType": tonFromType(source["type"]),
             }
+        ttMessage["recipient"] = dest
+        ttMessage["contentText"] = {"text": body}
+        return encode_json(ttMessage)
+
+    @defer.inlineCallbacks
+    def _sendBatch(self, encodedMessages):
+        """
+        Sends a batch of text messages to the gateway in a single request.
+
+        :param encodedMessages: The messages to send, each as encoded by
+            _encodeMessage.
+        :type encodedMessages: list[bytes]
 
-        body = {
-                    "auth": {
-                        "username": username,
-                        "password": password
-                    },
-                    "messages": [
-                        {
-                            "sender": source['text'],                            
-                            "senderType": tonFromType(source["type"]),
-                            "recipient": dest,
-                            "contentText": {
-                                "text": body
-                            }
-                        }
-                    ]
-                }
-
-        resp, responseJson = yield self.http_cli.post_json_get_body(
-            "https://api1.teletopiasms.no/gateway/v3/json", body, {}
+        :return: A deferred resolving to the gateway's responses, one per message
+            and in the same order.
+        :rtype: twisted.internet.defer.Deferred[list[dict[str, any]]]
+        """
+        body = self._bodyPrefix + b','.join(encodedMessages) + _BODY_SUFFIX
+
+        resp, responseJson = yield self.http_cli.post_json_bytes_get_body(
+            API_BASE_URL, body, {"headers": self._headers}
         )
 
         logger.info("Teletopia send sms http status code: %r", resp.code)
 
         if resp.code != 200:
-            raise Exception("Teletopia sending sms to gateway failed with code %r", resp.code)
+            raise Exception("Teletopia sending sms to gateway failed with code %r" % (resp.code,))
+
+        respBody = decode_json(responseJson)
+        ttResponses = respBody.get('responses') if isinstance(respBody, dict) else None
+        if not isinstance(ttResponses, list):
+            raise Exception("Teletopia gateway returned a malformed response: %r" % (respBody,))
 
-        s = responseJson.decode("utf8")
-        respBody = json.loads(s)
-        ttResponse = respBody['responses'][0]
+        defer.returnValue(ttResponses)
 
-        logger.info("Teletopia send sms to %r response.accepted          = %r", ttResponse['recipient'], ttResponse['accepted'])
-        logger.info("Teletopia send sms to %r response.messageId         = %r", ttResponse['recipient'], ttResponse['messageId'])
-        logger.info("Teletopia send sms to %r response.statusCode        = %r", ttResponse['recipient'], ttResponse['statusCode'])
-        logger.info("Teletopia send sms to %r response.statusDescription = %r", ttResponse['recipient'], ttResponse['statusCode'])
+    def _checkResponse(self, ttResponse):
+        """
+        Checks the gateway's response for a single message.
+
+        :param ttResponse: The gateway's response for the message.
+        :type ttResponse: dict[str, any]
+
+        :raises Exception: if the gateway didn't accept the message.
+        """
+        logger.info(
+            "Teletopia sms to %s: accepted=%s messageId=%s statusCode=%s statusDescription=%s",
+            ttResponse['recipient'], ttResponse['accepted'], ttResponse['messageId'],
+            ttResponse['statusCode'], ttResponse.get('statusDescription'),
+        )
 
-        if ttResponse['accepted'] != 1: 
+        if ttResponse['accepted'] != 1:
             raise Exception("Teletopia gateway did not accept sms message")
-        
-        if not (ttResponse['statusCode'] == 1000 or ttResponse['statusCode'] == 2000): 
-            raise Exception("Teletopia gateway accepted message but reported non-successful status code = %r", ttResponse['statusCode'])
+
+        if not (ttResponse['statusCode'] == 1000 or ttResponse['statusCode'] == 2000):
+            raise Exception("Teletopia gateway accepted message but reported non-successful status code = %r" % (ttResponse['statusCode'],))
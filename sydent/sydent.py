@@ -21,9 +21,11 @@ import gc
 
 from six.moves import configparser
 import copy
+import functools
 import logging
 import logging.handlers
 import os
+import socket
 
 import twisted.internet.reactor
 from twisted.internet import task
@@ -37,6 +39,7 @@ from sydent.http.httpserver import (
     InternalApiHttpServer,
 )
 from sydent.http.httpsclient import ReplicationHttpsClient
+from sydent.http.httpclient import SimpleHttpClient, make_http_pool
 from sydent.http.servlets.blindlysignstuffservlet import BlindlySignStuffServlet
 from sydent.http.servlets.pubkeyservlets import EphemeralPubkeyIsValidServlet, PubkeyIsValidServlet
 from sydent.http.servlets.termsservlet import TermsServlet
@@ -165,7 +168,42 @@ CONFIG_DEFAULTS = {
 }
 
 
-class Sydent:
+# All of CONFIG_DEFAULTS' options in a single dict, for use as a ConfigParser's
+# DEFAULT section. Where an option appears in several sections, the last one wins.
+_flat_config_defaults = {
+    k: v for entries in CONFIG_DEFAULTS.values() for k, v in entries.items()
+}
+
+
+class LazyComponent(object):
+    """A Sydent attribute which is created by calling the given factory with the
+    Sydent instance the first time it's accessed, then stored on the instance.
+
+    :param name: The name of the attribute.
+    :type name: str
+    :param factory: The callable creating the component.
+    :type factory: callable
+    """
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        component = self.factory(instance)
+        # This shadows the descriptor, so later accesses don't go through it.
+        instance.__dict__[self.name] = component
+        return component
+
+
+class Sydent(object):
+    # Components which are only created the first time they're used.
+    sslComponents = LazyComponent('sslComponents', SslComponents)
+    clientApiHttpServer = LazyComponent('clientApiHttpServer', ClientApiHttpServer)
+    replicationHttpsServer = LazyComponent('replicationHttpsServer', ReplicationHttpsServer)
+    pusher = LazyComponent('pusher', Pusher)
+
     def __init__(self, cfg, reactor=twisted.internet.reactor):
         self.reactor = reactor
         self.config_file = get_config_file_path()
@@ -180,7 +218,7 @@ class Sydent:
 
         self.server_name = self.cfg.get('general', 'server.name')
         if self.server_name == '':
-            self.server_name = os.uname()[1]
+            self.server_name = socket.gethostname()
             logger.warn(("You had not specified a server name. I have guessed that this server is called '%s' "
                         + "and saved this in the config file. If this is incorrect, you should edit server.name in "
                         + "the config file.") % (self.server_name,))
@@ -231,6 +269,15 @@ class Sydent:
             hashing_metadata_store.store_lookup_pepper(sha256_and_url_safe_base64,
                                                        lookup_pepper)
 
+        # A single persistent connection pool, and a single client using it, for
+        # plain outbound HTTP requests (e.g. to the SMS gateways). The pool's
+        # connections are closed when the reactor shuts down.
+        self.http_pool = make_http_pool(self.reactor)
+        self.reactor.addSystemEventTrigger(
+            'before', 'shutdown', self.http_pool.closeCachedConnections,
+        )
+        self.http_client = SimpleHttpClient(self)
+
         self.validators = Validators()
         self.validators.email = EmailValidator(self)
         self.validators.msisdn = MsisdnValidator(self)
@@ -241,40 +288,37 @@ class Sydent:
 
         self.sig_verifier = Verifier(self)
 
-        self.servlets = Servlets()
-        self.servlets.v1 = V1Servlet(self)
-        self.servlets.v2 = V2Servlet(self)
-        self.servlets.emailRequestCode = EmailRequestCodeServlet(self)
-        self.servlets.emailValidate = EmailValidateCodeServlet(self)
-        self.servlets.msisdnRequestCode = MsisdnRequestCodeServlet(self)
-        self.servlets.msisdnValidate = MsisdnValidateCodeServlet(self)
-        self.servlets.lookup = LookupServlet(self)
-        self.servlets.bulk_lookup = BulkLookupServlet(self)
-        self.servlets.hash_details = HashDetailsServlet(self, lookup_pepper)
-        self.servlets.lookup_v2 = LookupV2Servlet(self, lookup_pepper)
-        self.servlets.pubkey_ed25519 = Ed25519Servlet(self)
-        self.servlets.pubkeyIsValid = PubkeyIsValidServlet(self)
-        self.servlets.ephemeralPubkeyIsValid = EphemeralPubkeyIsValidServlet(self)
-        self.servlets.threepidBind = ThreePidBindServlet(self)
-        self.servlets.threepidUnbind = ThreePidUnbindServlet(self)
-        self.servlets.replicationPush = ReplicationPushServlet(self)
-        self.servlets.getValidated3pid = GetValidated3pidServlet(self)
-        self.servlets.storeInviteServlet = StoreInviteServlet(self)
-        self.servlets.blindlySignStuffServlet = BlindlySignStuffServlet(self)
-        self.servlets.termsServlet = TermsServlet(self)
-        self.servlets.accountServlet = AccountServlet(self)
-        self.servlets.registerServlet = RegisterServlet(self)
-        self.servlets.logoutServlet = LogoutServlet(self)
+        # Servlets are only created the first time they're used (which for most
+        # of them is when the HTTP servers are set up).
+        self.servlets = Servlets(self, {
+            'v1': V1Servlet,
+            'v2': V2Servlet,
+            'emailRequestCode': EmailRequestCodeServlet,
+            'emailValidate': EmailValidateCodeServlet,
+            'msisdnRequestCode': MsisdnRequestCodeServlet,
+            'msisdnValidate': MsisdnValidateCodeServlet,
+            'lookup': LookupServlet,
+            'bulk_lookup': BulkLookupServlet,
+            'hash_details': functools.partial(HashDetailsServlet, lookup_pepper=lookup_pepper),
+            'lookup_v2': functools.partial(LookupV2Servlet, lookup_pepper=lookup_pepper),
+            'pubkey_ed25519': Ed25519Servlet,
+            'pubkeyIsValid': PubkeyIsValidServlet,
+            'ephemeralPubkeyIsValid': EphemeralPubkeyIsValidServlet,
+            'threepidBind': ThreePidBindServlet,
+            'threepidUnbind': ThreePidUnbindServlet,
+            'replicationPush': ReplicationPushServlet,
+            'getValidated3pid': GetValidated3pidServlet,
+            'storeInviteServlet': StoreInviteServlet,
+            'blindlySignStuffServlet': BlindlySignStuffServlet,
+            'termsServlet': TermsServlet,
+            'accountServlet': AccountServlet,
+            'registerServlet': RegisterServlet,
+            'logoutServlet': LogoutServlet,
+        })
 
-        self.threepidBinder = ThreepidBinder(self)
-
-        self.sslComponents = SslComponents(self)
-
-        self.clientApiHttpServer = ClientApiHttpServer(self)
-        self.replicationHttpsServer = ReplicationHttpsServer(self)
         self.replicationHttpsClient = ReplicationHttpsClient(self)
 
-        self.pusher = Pusher(self)
+        self.threepidBinder = ThreepidBinder(self)
 
         # A dedicated validation session store just to clean up old sessions every N minutes
         self.cleanupValSession = ThreePidValSessionStore(self)
@@ -326,7 +370,26 @@ class Validators:
 
 
 class Servlets:
-    pass
+    """Holds Sydent's servlets, each of which is created the first time it's
+    accessed.
+
+    :param sydent: The Sydent instance to create the servlets with.
+    :type sydent: Sydent
+    :param factories: A map from servlet name to a callable creating the
+        servlet, which is given the Sydent instance as its only argument.
+    :type factories: dict[str, callable]
+    """
+    def __init__(self, sydent, factories):
+        self._sydent = sydent
+        self._factories = factories
+
+    def __getattr__(self, name):
+        # Only called if the servlet hasn't been created yet.
+        if name.startswith('_') or name not in self._factories:
+            raise AttributeError(name)
+        servlet = self._factories[name](self._sydent)
+        setattr(self, name, servlet)
+        return servlet
 
 
 class Keyring:
@@ -371,11 +434,16 @@ def parse_config_file(config_file):
     # in their config file in the default section (which is likely,
     # because sydent used to be braindead).
     use_defaults = not os.path.exists(config_file)
-    cfg = configparser.ConfigParser()
-    for sect, entries in CONFIG_DEFAULTS.items():
-        cfg.add_section(sect)
-        for k, v in entries.items():
-            cfg.set(configparser.DEFAULTSECT if use_defaults else sect, k, v)
+    if use_defaults:
+        cfg = configparser.ConfigParser(defaults=_flat_config_defaults)
+        for sect in CONFIG_DEFAULTS:
+            cfg.add_section(sect)
+    else:
+        cfg = configparser.ConfigParser()
+        for sect, entries in CONFIG_DEFAULTS.items():
+            cfg.add_section(sect)
+            for k, v in entries.items():
+                cfg.set(sect, k, v)
 
     cfg.read(config_file)
 
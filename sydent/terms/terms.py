@@ -15,11 +15,17 @@
 # limitations under the License.
 
 import logging
+import os
 import yaml
 
 
 logger = logging.getLogger(__name__)
 
+# Parsed terms files, keyed by absolute path, as ((mtime, size), Terms) tuples.
+# Terms are read for every authenticated request, so only re-parse the file when
+# it changes.
+_terms_cache = {}
+
 
 class Terms(object):
     def __init__(self, yamlObj):
@@ -102,7 +108,8 @@ class Terms(object):
         return agreed == required
 
 def get_terms(sydent):
-    """Read and parse terms as specified in the config.
+    """Read and parse terms as specified in the config. The result is cached
+    until the file's mtime or size changes.
 
     :returns Terms
     """
@@ -112,6 +119,15 @@ def get_terms(sydent):
         if termsPath == '':
             return Terms(None)
 
+        termsPath = os.path.abspath(termsPath)
+        # The size is checked as well as the mtime, as copying a file over
+        # another can keep its mtime.
+        st = os.stat(termsPath)
+        fileVersion = (st.st_mtime, st.st_size)
+        cached = _terms_cache.get(termsPath)
+        if cached is not None and cached[0] == fileVersion:
+            return cached[1]
+
         with open(termsPath) as fp:
             termsYaml = yaml.full_load(fp)
         if 'master_version' not in termsYaml:
@@ -129,6 +145,8 @@ def get_terms(sydent):
                 if 'url' not in lang:
                     raise Exception("lang '%s' of doc %s has no url" % (langKey, docName))
 
-        return Terms(termsYaml)
+        terms = Terms(termsYaml)
+        _terms_cache[termsPath] = (fileVersion, terms)
+        return terms
     except Exception:
         logger.exception("Couldn't read terms file '%s'", sydent.cfg.get('general', 'terms.path'))
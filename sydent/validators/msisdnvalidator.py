@@ -60,11 +60,10 @@ class MsisdnValidator:
             if opt.startswith('originators.'):
                 country = opt.split('.')[1]
                 rawVal = item[1]
-                rawList = [i.strip() for i in rawVal.split(',')]
 
                 self.originators[country] = []
-                for origString in rawList:
-                    parts = origString.split(':')
+                for origString in rawVal.split(','):
+                    parts = origString.strip().split(':')
                     if len(parts) != 2:
                         raise Exception("Originators must be in form: long:<number>, short:<number> or alpha:<text>, separated by commas")
                     if parts[0] not in ['long', 'short', 'alpha']:
@@ -143,7 +142,12 @@ class MsisdnValidator:
 
         smsBody = smsBodyTemplate.format(token=valSession.token)
 
-        self.smsGateway.sendTextSMS(smsBody, msisdn, originator)
+        # Don't wait for the gateway to send the message, as it may batch it with
+        # others first, but make sure a failure to send it gets logged.
+        d = self.smsGateway.sendTextSMS(smsBody, msisdn, originator)
+        d.addErrback(
+            lambda f: logger.error("Failed to send text message to %s: %s", msisdn, f.getErrorMessage())
+        )
 
         valSessionStore.setSendAttemptNumber(valSession.id, sendAttempt)
 
@@ -0,0 +1,33 @@
+import os
+
+from twisted.trial import unittest
+
+from tests.utils import make_sydent
+
+
+class SqliteUriTestCase(unittest.TestCase):
+    """Tests that db.file can be an SQLite URI as well as a path."""
+
+    def assertSchemaCreated(self, sydent):
+        cur = sydent.db.cursor()
+        cur.execute("PRAGMA user_version")
+        self.assertGreater(cur.fetchone()[0], 0)
+
+        cur.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+            ("threepid_validation_sessions",),
+        )
+        self.assertIsNotNone(cur.fetchone())
+
+    def test_memory_uri(self):
+        sydent = make_sydent({"db": {"db.file": "file::memory:"}})
+        self.assertSchemaCreated(sydent)
+
+    def test_file_uri_with_mode(self):
+        # If the URI were taken as a path, this would create a file named after
+        # the whole URI rather than the one it points to.
+        path = os.path.abspath(self.mktemp())
+        sydent = make_sydent({"db": {"db.file": "file:%s?mode=rwc" % (path,)}})
+
+        self.assertSchemaCreated(sydent)
+        self.assertTrue(os.path.exists(path))
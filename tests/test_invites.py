@@ -1,4 +1,6 @@
-from mock import Mock
+import copy
+
+from mock import Mock, patch
 from sydent.http.httpclient import FederationHttpClient
 from sydent.db.invite_tokens import JoinTokenStore
 from tests.utils import make_sydent
@@ -7,38 +9,51 @@ from twisted.trial import unittest
 from sydent.http.servlets.store_invite_servlet import StoreInviteServlet
 
 
-class ThreepidInvitesTestCase(unittest.TestCase):
-    """Tests features related to storing and delivering 3PID invites."""
+class InvitesTestCase(unittest.TestCase):
+    """A test case where each test gets a new sydent built from `sydent_config`, and
+    /onBind calls to homeservers are mocked for the duration of the test.
+    """
+
+    sydent_config = {}
 
     def setUp(self):
         # Create a new sydent
-        config = {
-            "email": {
-                # Used by test_invited_email_address_obfuscation
-                "email.third_party_invite_username_obfuscate_characters": "6",
-                "email.third_party_invite_domain_obfuscate_characters": "8",
-            },
-        }
-        self.sydent = make_sydent(test_config=config)
+        self.sydent = make_sydent(test_config=copy.deepcopy(self.sydent_config))
+
+        # Mock post_json_get_nothing so the /onBind call doesn't fail.
+        def post_json_get_nothing(uri, post_json, opts):
+            return Response((b'HTTP', 1, 1), 200, b'OK', None, None)
+
+        patcher = patch.object(
+            FederationHttpClient, "post_json_get_nothing",
+            Mock(side_effect=post_json_get_nothing),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ThreepidInvitesTestCase(InvitesTestCase):
+    """Tests features related to storing and delivering 3PID invites."""
+
+    sydent_config = {
+        "email": {
+            # Used by test_invited_email_address_obfuscation
+            "email.third_party_invite_username_obfuscate_characters": "6",
+            "email.third_party_invite_domain_obfuscate_characters": "8",
+        },
+    }
 
     def test_delete_on_bind(self):
         """Tests that 3PID invite tokens are deleted upon delivery after a successful
         bind.
         """
-        self.sydent.run()
+        # Only the pusher is needed to deliver invites on bind.
+        self.sydent.pusher.setup()
 
         # The 3PID we're working with.
         medium = "email"
         address = "john@example.com"
 
-        # Mock post_json_get_nothing so the /onBind call doesn't fail.
-        def post_json_get_nothing(uri, post_json, opts):
-            return Response((b'HTTP', 1, 1), 200, b'OK', None, None)
-
-        FederationHttpClient.post_json_get_nothing = Mock(
-            side_effect=post_json_get_nothing,
-        )
-
         # Manually insert an invite token, we'll check later that it's been deleted.
         join_token_store = JoinTokenStore(self.sydent)
         join_token_store.storeToken(
@@ -91,34 +106,24 @@ class ThreepidInvitesTestCase(unittest.TestCase):
         self.assertEqual(redacted_address, "...@1...")
 
 
-class ThreepidInvitesNoDeleteTestCase(unittest.TestCase):
+class ThreepidInvitesNoDeleteTestCase(InvitesTestCase):
     """Test that invite tokens are not deleted when that is disabled.
     """
 
-    def setUp(self):
-        # Create a new sydent
-        config = {
-            "general": {
-                "delete_tokens_on_bind": "false"
-            }
+    sydent_config = {
+        "general": {
+            "delete_tokens_on_bind": "false"
         }
-        self.sydent = make_sydent(test_config=config)
+    }
 
     def test_no_delete_on_bind(self):
-        self.sydent.run()
+        # Only the pusher is needed to deliver invites on bind.
+        self.sydent.pusher.setup()
 
         # The 3PID we're working with.
         medium = "email"
         address = "john@example.com"
 
-        # Mock post_json_get_nothing so the /onBind call doesn't fail.
-        def post_json_get_nothing(uri, post_json, opts):
-            return Response((b'HTTP', 1, 1), 200, b'OK', None, None)
-
-        FederationHttpClient.post_json_get_nothing = Mock(
-            side_effect=post_json_get_nothing,
-        )
-
         # Manually insert an invite token, we'll check later that it's been deleted.
         join_token_store = JoinTokenStore(self.sydent)
         join_token_store.storeToken(
@@ -0,0 +1,215 @@
+import json
+
+import phonenumbers
+from mock import Mock, patch
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from sydent.db.valsession import ThreePidValSessionStore
+from sydent.sms import teletopia
+from tests.utils import make_sydent
+
+
+class TeletopiaBatchingTestCase(unittest.TestCase):
+    """Tests that text messages sent through the Teletopia gateway are batched
+    into a single request, and that each sender gets its own message's result.
+    """
+
+    def setUp(self):
+        config = {
+            "sms": {
+                "use_gateway": "teletopia",
+            },
+            "sms.teletopia": {
+                "username": "someuser",
+                "password": "somepassword",
+            },
+        }
+        self.sydent = make_sydent(test_config=config)
+        self.gateway = self.sydent.validators.msisdn.smsGateway
+
+        # Each POST to the gateway is recorded along with a Deferred the test can
+        # resolve with the gateway's response.
+        self.requests = []
+
+        def post_json_bytes_get_body(uri, json_bytes, opts):
+            d = defer.Deferred()
+            self.requests.append((json.loads(json_bytes.decode("utf8")), d))
+            return d
+
+        self.gateway.http_cli = Mock()
+        self.gateway.http_cli.post_json_bytes_get_body = Mock(
+            side_effect=post_json_bytes_get_body,
+        )
+
+    def respond(self, index, ttResponses, code=200):
+        """Resolves the given request to the gateway with the given responses."""
+        _, d = self.requests[index]
+        d.callback((Mock(code=code), json.dumps({"responses": ttResponses}).encode("utf8")))
+
+    def accepted(self, recipient):
+        return {
+            "recipient": recipient,
+            "accepted": 1,
+            "messageId": "id-" + recipient,
+            "statusCode": 1000,
+            "statusDescription": "OK",
+        }
+
+    def test_batches_messages_until_flush_delay(self):
+        d1 = self.gateway.sendTextSMS("Your code is 1", "4711111111")
+        d2 = self.gateway.sendTextSMS(
+            "Your code is 2", "4722222222", {"type": "short", "text": "1234"},
+        )
+
+        # Nothing is sent until the flush delay has passed.
+        self.assertEqual(len(self.requests), 0)
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+        self.assertEqual(len(self.requests), 1)
+
+        body, _ = self.requests[0]
+        self.assertEqual(
+            body["auth"], {"username": "someuser", "password": "somepassword"},
+        )
+        self.assertEqual(body["messages"], [
+            {
+                "sender": "Matrix",
+                "senderType": teletopia.TONS["alpha"],
+                "recipient": "4711111111",
+                "contentText": {"text": "Your code is 1"},
+            },
+            {
+                "sender": "1234",
+                "senderType": teletopia.TONS["short"],
+                "recipient": "4722222222",
+                "contentText": {"text": "Your code is 2"},
+            },
+        ])
+
+        self.assertNoResult(d1)
+        self.respond(0, [self.accepted("4711111111"), self.accepted("4722222222")])
+        self.successResultOf(d1)
+        self.successResultOf(d2)
+
+    def test_flushes_full_batch_immediately(self):
+        for i in range(teletopia.BATCH_MAX_SIZE):
+            self.gateway.sendTextSMS("Your code is %d" % i, "47%08d" % i)
+
+        self.assertEqual(len(self.requests), 1)
+        body, _ = self.requests[0]
+        self.assertEqual(len(body["messages"]), teletopia.BATCH_MAX_SIZE)
+
+        # The next message starts a new batch.
+        self.gateway.sendTextSMS("Your code is x", "4799999999")
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+        self.assertEqual(len(self.requests), 2)
+        body, _ = self.requests[1]
+        self.assertEqual(len(body["messages"]), 1)
+
+    def test_results_are_per_message(self):
+        d1 = self.gateway.sendTextSMS("Your code is 1", "4711111111")
+        d2 = self.gateway.sendTextSMS("Your code is 2", "4722222222")
+        d3 = self.gateway.sendTextSMS("Your code is 3", "4733333333")
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+
+        rejected = self.accepted("4722222222")
+        rejected["accepted"] = 0
+        # The gateway only answers for the first two messages.
+        self.respond(0, [self.accepted("4711111111"), rejected])
+
+        self.successResultOf(d1)
+        self.failureResultOf(d2, Exception)
+        self.failureResultOf(d3, Exception)
+        self.assertEqual(self.gateway._queued, 0)
+
+    def test_non_200_fails_whole_batch(self):
+        d1 = self.gateway.sendTextSMS("Your code is 1", "4711111111")
+        d2 = self.gateway.sendTextSMS("Your code is 2", "4722222222")
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+
+        self.respond(0, [], code=500)
+
+        f = self.failureResultOf(d1, Exception)
+        self.assertEqual(
+            f.getErrorMessage(), "Teletopia sending sms to gateway failed with code 500",
+        )
+        self.failureResultOf(d2, Exception)
+
+    def test_malformed_response_fails_whole_batch(self):
+        d = self.gateway.sendTextSMS("Your code is 1", "4711111111")
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+
+        self.respond(0, None)
+
+        self.failureResultOf(d, Exception)
+        self.assertEqual(self.gateway._queued, 0)
+
+    def test_invalid_message_only_fails_itself(self):
+        bad = self.gateway.sendTextSMS(
+            "Your code is 1", "4711111111", {"type": "bogus", "text": "1234"},
+        )
+        good = self.gateway.sendTextSMS("Your code is 2", "4722222222")
+
+        self.failureResultOf(bad, Exception)
+
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+        self.assertEqual(len(self.requests), 1)
+        body, _ = self.requests[0]
+        self.assertEqual(
+            [m["recipient"] for m in body["messages"]], ["4722222222"],
+        )
+
+        self.respond(0, [self.accepted("4722222222")])
+        self.successResultOf(good)
+
+    def test_rejects_messages_past_queue_limit(self):
+        with patch.object(teletopia, "MAX_QUEUED_MESSAGES", 2):
+            d1 = self.gateway.sendTextSMS("Your code is 1", "4711111111")
+            d2 = self.gateway.sendTextSMS("Your code is 2", "4722222222")
+            d3 = self.gateway.sendTextSMS("Your code is 3", "4733333333")
+
+            # The third message is rejected straight away, and isn't sent.
+            self.failureResultOf(d3, Exception)
+            self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+            self.assertEqual(len(self.requests), 1)
+            body, _ = self.requests[0]
+            self.assertEqual(len(body["messages"]), 2)
+
+            # Once the gateway has answered, there is room in the queue again.
+            self.respond(0, [self.accepted("4711111111"), self.accepted("4722222222")])
+            self.successResultOf(d1)
+            self.successResultOf(d2)
+            d4 = self.gateway.sendTextSMS("Your code is 4", "4744444444")
+            self.assertNoResult(d4)
+
+    def test_limits_concurrent_requests(self):
+        for i in range((teletopia.MAX_CONCURRENT_REQUESTS + 1) * teletopia.BATCH_MAX_SIZE):
+            self.gateway.sendTextSMS("Your code is %d" % i, "47%08d" % i)
+
+        # The last batch waits for one of the requests in flight to finish.
+        self.assertEqual(len(self.requests), teletopia.MAX_CONCURRENT_REQUESTS)
+
+        self.respond(0, [self.accepted("47%08d" % i) for i in range(teletopia.BATCH_MAX_SIZE)])
+        self.assertEqual(len(self.requests), teletopia.MAX_CONCURRENT_REQUESTS + 1)
+
+    def test_request_token_does_not_wait_for_gateway(self):
+        phone_number = phonenumbers.parse("+447700900000", None)
+
+        sid = self.sydent.validators.msisdn.requestToken(phone_number, "foobar", 1)
+
+        # The session is returned while the message is still waiting to be sent.
+        self.assertIsInstance(sid, int)
+        self.assertEqual(len(self.requests), 0)
+        self.sydent.reactor.advance(teletopia.BATCH_FLUSH_DELAY)
+        self.assertEqual(len(self.requests), 1)
+        body, _ = self.requests[0]
+        self.assertEqual(body["messages"][0]["recipient"], "447700900000")
+
+        # The send attempt is recorded without waiting for the gateway either.
+        session = ThreePidValSessionStore(self.sydent).getTokenSessionById(sid)
+        self.assertEqual(session.sendAttemptNumber, 1)
+
+        # A failure to send it is only logged.
+        with self.assertLogs("sydent.validators.msisdnvalidator", "ERROR") as cm:
+            self.respond(0, [], code=500)
+        self.assertIn("447700900000", cm.output[0])
@@ -0,0 +1,60 @@
+import os
+
+from twisted.trial import unittest
+
+from sydent.terms.terms import get_terms
+from tests.utils import make_sydent
+
+
+TERMS_TEMPLATE = """
+master_version: "%s"
+docs:
+  privacy_policy:
+    version: "%s"
+    langs:
+      en:
+        name: "Privacy Policy"
+        url: "https://example.org/privacy-%s.html"
+"""
+
+
+class TermsTestCase(unittest.TestCase):
+    """Tests that the terms file is re-read when it changes."""
+
+    def setUp(self):
+        self.terms_path = os.path.abspath(self.mktemp())
+        self.write_terms("1.0")
+
+        self.sydent = make_sydent(test_config={
+            "general": {
+                "terms.path": self.terms_path,
+            },
+        })
+
+    def write_terms(self, version):
+        with open(self.terms_path, "w") as fp:
+            fp.write(TERMS_TEMPLATE % (version, version, version))
+
+    def test_unchanged_file_is_cached(self):
+        terms = get_terms(self.sydent)
+        self.assertEqual(terms.getMasterVersion(), "1.0")
+        self.assertIs(get_terms(self.sydent), terms)
+
+    def test_rewritten_file_is_reread(self):
+        self.assertEqual(get_terms(self.sydent).getMasterVersion(), "1.0")
+        st = os.stat(self.terms_path)
+
+        # Same size, but a later mtime.
+        self.write_terms("2.0")
+        os.utime(self.terms_path, (st.st_atime, st.st_mtime + 1))
+        self.assertEqual(get_terms(self.sydent).getMasterVersion(), "2.0")
+
+    def test_rewritten_file_with_same_mtime_is_reread(self):
+        self.assertEqual(get_terms(self.sydent).getMasterVersion(), "1.0")
+        st = os.stat(self.terms_path)
+
+        # Replace the file the way e.g. "cp -p" would, keeping its mtime.
+        self.write_terms("2.0.1")
+        os.utime(self.terms_path, (st.st_atime, st.st_mtime))
+
+        self.assertEqual(get_terms(self.sydent).getMasterVersion(), "2.0.1")